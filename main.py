@@ -1,89 +1,136 @@
 # main_app.py
 import streamlit as st
 import base64
-from PIL import Image
+import hashlib
+import hmac
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from PIL import Image, ImageOps
 from io import BytesIO
-from typing import List, Optional, Type
+from typing import Annotated, Callable, List, Optional, Type
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 # --- Core Dependencies ---
-from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
-from langchain_core.output_parsers.json import JsonOutputParser
+import orjson
+from pydantic import AfterValidator, BaseModel, Field, ValidationError, create_model, model_validator
+from modules.generator import JsonMemberScanner
+# LangChain/Gemini imports are deferred to the generation path; UI-only reruns never need them.
 
 # --- Load Environment Variables ---
 load_dotenv()
 
+# --- Page Configuration ---
+st.set_page_config(
+    page_title="AI Social Content Generator 📱✨",
+    page_icon="🚀",
+    layout="wide",
+)
+
 # --- ADDED FOR AUTHENTICATION ---
+@st.cache_resource(show_spinner=False)
+def get_password_hash() -> Optional[bytes]:
+    """Hashes APP_PASSWORD once per process; returns None when it is unset so nobody can log in."""
+    app_password = os.getenv("APP_PASSWORD")
+    return hashlib.sha256(app_password.encode("utf-8")).digest() if app_password else None
+
+def password_matches(candidate_hash: bytes) -> bool:
+    """Checks a submitted password digest against the configured one in constant time."""
+    password_hash = get_password_hash()
+    return password_hash is not None and hmac.compare_digest(candidate_hash, password_hash)
+
 def check_password():
     """Returns `True` if the user had the correct password."""
     if "password_correct" not in st.session_state:
         st.session_state["password_correct"] = False
     if st.session_state["password_correct"]:
         return True
-    st.header("🔐 Secure Access")
-    password = st.text_input("Enter the password to access the app", type="password")
-    if st.button("Login"):
-        correct_password = os.getenv("APP_PASSWORD")
-        if password == correct_password:
+    login_form = st.empty()
+    with login_form.container():
+        st.header("🔐 Secure Access")
+        password = st.text_input("Enter the password to access the app", type="password")
+        submitted = st.button("Login")
+    if submitted:
+        if password_matches(hashlib.sha256(password.encode("utf-8")).digest()):
+            # Clear the form and continue into the app on this run instead of paying for a full rerun.
             st.session_state["password_correct"] = True
-            st.rerun()
-        else:
-            st.error("😕 Incorrect password. Please try again.")
+            login_form.empty()
+            return True
+        st.error("😕 Incorrect password. Please try again.")
     return False
 
 if not check_password():
     st.stop()
 # ------------------------------------
 
-# --- Page & Session State Configuration ---
-st.set_page_config(
-    page_title="AI Social Content Generator 📱✨",
-    page_icon="🚀",
-    layout="wide",
-)
-
-# Initialize session state
-if "generated_content" not in st.session_state:
-    st.session_state.generated_content = {}
-if "image_base64" not in st.session_state:
-    st.session_state.image_base64 = None
-if "platforms_selected" not in st.session_state:
-    st.session_state.platforms_selected = []
-if "business_context" not in st.session_state:
-    st.session_state.business_context = ""
-if "last_uploaded_filename" not in st.session_state:
-    st.session_state.last_uploaded_filename = None
-if "just_generated" not in st.session_state:
-    st.session_state.just_generated = False
-# --- NEW: Session state for the PIL image object ---
-if "pil_image" not in st.session_state:
-    st.session_state.pil_image = None
+# --- Session State Configuration ---
+# Initialize session state; app fields share one slotted object so each rerun does a single membership check.
+@dataclass(slots=True)
+class AppState:
+    generated_content: dict = field(default_factory=dict)
+    image_jpeg_bytes: Optional[bytes] = None
+    platforms_selected: list = field(default_factory=list)
+    business_context: str = ""
+    last_uploaded_filename: Optional[str] = None
+    just_generated: bool = False
+    display_cache: dict = field(default_factory=dict)
+    image_sha: Optional[str] = None
+    resume_key: Optional[tuple] = None
+
+if "app" not in st.session_state:
+    st.session_state.app = AppState()
+app_state = st.session_state.app
 
 # --- Pydantic Models for Structured Output ---
+def _ensure_hash_prefix(tags: List[str]) -> List[str]:
+    """Adds any missing '#'; an already valid list is returned unchanged without being copied."""
+    if all(tag.startswith('#') for tag in tags):
+        return tags
+    return [tag if tag.startswith('#') else f"#{tag}" for tag in tags]
+
+def _strip_hash_prefix(keywords: List[str]) -> List[str]:
+    if not any(keyword.startswith('#') for keyword in keywords):
+        return keywords
+    return [keyword.lstrip('#') for keyword in keywords]
+
+Hashtags = Annotated[List[str], AfterValidator(_ensure_hash_prefix)]
+Keywords = Annotated[List[str], AfterValidator(_strip_hash_prefix)]
+
+INSTAGRAM_MAX_CAPTION = 2200
+INSTAGRAM_HASHTAG_SEPARATOR = "\n\n.\n.\n.\n\n"
+
 class InstagramContent(BaseModel):
-    caption: str = Field(description="Engaging Instagram caption (max 2,200 chars), use emojis.")
-    hashtags: List[str] = Field(description="List of 15-20 relevant hashtags, each starting with '#'.")
+    caption: str = Field(description="Engaging Instagram caption (max 2,200 chars), use emojis.", max_length=INSTAGRAM_MAX_CAPTION)
+    hashtags: Hashtags = Field(description="List of 15-20 relevant hashtags, each starting with '#'.", max_length=30)
     alt_text: str = Field(description="Descriptive alt text for accessibility (max 125 chars).")
 
+    @model_validator(mode="after")
+    def _check_posted_length(self):
+        # The hashtags are posted inside the caption, so the limit applies to both together.
+        posted_length = len(self.caption) + len(INSTAGRAM_HASHTAG_SEPARATOR) + len(" ".join(self.hashtags))
+        if posted_length > INSTAGRAM_MAX_CAPTION:
+            raise ValueError(f"caption plus hashtags is {posted_length} characters; Instagram allows at most {INSTAGRAM_MAX_CAPTION}")
+        return self
+
 class FacebookContent(BaseModel):
     post_text: str = Field(description="Compelling Facebook post text, can be longer and more detailed. Use emojis and ask a question to encourage engagement.")
     headline: Optional[str] = Field(description="An optional catchy headline if the post is promotional.")
 
 class XContent(BaseModel):
-    tweet: str = Field(description="Concise and impactful tweet (max 280 chars). Use emojis and 2-3 key hashtags.")
-    hashtags: List[str] = Field(description="A list of 2-3 relevant hashtags for the tweet, each starting with '#'.")
+    tweet: str = Field(description="Concise and impactful tweet (max 280 chars). Use emojis and 2-3 key hashtags.", max_length=280)
+    hashtags: Hashtags = Field(description="A list of 2-3 relevant hashtags for the tweet, each starting with '#'.")
 
 class PinterestContent(BaseModel):
-    title: str = Field(description="SEO-friendly Pinterest pin title (max 100 chars).")
-    description: str = Field(description="Detailed description with keywords (max 500 chars).")
-    keywords: List[str] = Field(description="List of 10-15 keywords, without '#'.")
+    title: str = Field(description="SEO-friendly Pinterest pin title (max 100 chars).", max_length=100)
+    description: str = Field(description="Detailed description with keywords (max 500 chars).", max_length=500)
+    keywords: Keywords = Field(description="List of 10-15 keywords, without '#'.")
 
 class LinkedInContent(BaseModel):
     post_text: str = Field(description="Professional and insightful LinkedIn post. Share expertise or company news. Use 3-5 professional hashtags.")
-    hashtags: List[str] = Field(description="List of 3-5 professional hashtags, each starting with '#'.")
+    hashtags: Hashtags = Field(description="List of 3-5 professional hashtags, each starting with '#'.")
 
 # --- Platform Configuration ---
 PLATFORM_CONFIG = {
@@ -94,38 +141,305 @@ PLATFORM_CONFIG = {
     "linkedin": {"name": "LinkedIn", "icon": "💼", "pydantic_model": LinkedInContent, "prompt": "Compose a professional LinkedIn post. The tone should be informative, industry-relevant, or share company insights. Include 3-5 professional hashtags."}
 }
 
+MODEL_NAME = "gemini-2.5-flash"
+RESPONSE_CACHE_DIR = Path(".cache") / "gemini"
+RESPONSE_CACHE_TTL = 24 * 3600  # seconds
+GENERATION_LEDGER_DIR = Path(".cache") / "gen"
+MAX_IMAGE_SIZE = (1024, 1024)
+REQUEST_TIMEOUT = 30  # seconds per Gemini call, per platform for the combined streamed call
+MAX_CONCURRENT_REQUESTS = 3  # keeps fallback fan-out within Gemini's per-minute quota
+
+# --- Prompt Templates ---
+# Only the business context varies per request; the suffix is fixed per platform combination.
+PROMPT_PREFIX = (
+    "You are an expert social media manager. Your task is to create content for each platform listed below "
+    "based on the provided image and business context.\n"
+    "**Business Context:**\n"
+)
+PROMPT_SUFFIX_TEMPLATE = (
+    "\n**Platform Instructions:**\n{platform_instructions}\n"
+    "**Output Format:**\n"
+    "You MUST provide your response in a valid JSON object that strictly follows this schema, with one entry per platform key. "
+    "Do not add any text before or after the JSON.\n"
+    "Schema:\n{format_instructions}\n"
+)
+PLATFORM_INSTRUCTION_TEMPLATE = "- {name} (JSON key `{key}`): {prompt}"
+REPAIR_PROMPT_TEMPLATE = (
+    "Your previous {name} content did not match the required schema.\n"
+    "**Previous Output:**\n{previous_output}\n"
+    "**Fix Only These Problems:**\n{feedback}\n"
+    "Return the full corrected JSON object for {name} and nothing else. Schema:\n{schema}\n"
+)
+
+# --- Cached Resources ---
+@st.cache_resource(show_spinner=False)
+def get_llm(model: str, temperature: float, timeout: float = REQUEST_TIMEOUT):
+    """Returns a shared Gemini client so its HTTP channel and auth are reused across calls and reruns."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=temperature,
+        timeout=timeout,
+        google_api_key=os.getenv("GOOGLE_API_KEY")
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_combined_model(platform_keys: tuple[str, ...]) -> Type[BaseModel]:
+    """Returns one Pydantic model per platform combination, nesting each platform's model under its key."""
+    return create_model(
+        "CombinedContent",
+        **{key: (PLATFORM_CONFIG[key]['pydantic_model'], ...) for key in platform_keys}
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_format_instructions(platform_keys: tuple[str, ...]) -> str:
+    """Returns the schema instructions for a platform combination, built once per process."""
+    schema = orjson.dumps(get_combined_model(platform_keys).model_json_schema()).decode("utf-8")
+    return f"The output must be a JSON instance that conforms to this JSON schema:\n```\n{schema}\n```"
+
+@st.cache_resource(show_spinner=False)
+def get_prompt_suffix(platform_keys: tuple[str, ...]) -> str:
+    """Returns the platform instructions and schema part of the prompt, built once per platform combination."""
+    return PROMPT_SUFFIX_TEMPLATE.format_map({
+        "platform_instructions": "\n".join(
+            PLATFORM_INSTRUCTION_TEMPLATE.format_map({"key": key, **PLATFORM_CONFIG[key]})
+            for key in platform_keys
+        ),
+        "format_instructions": get_format_instructions(platform_keys),
+    })
+
+@st.cache_resource(show_spinner=False)
+def get_schema_version(platform_key: str) -> str:
+    """Fingerprints a platform's prompt and output schema so cached responses expire when either changes."""
+    config = PLATFORM_CONFIG[platform_key]
+    schema = orjson.dumps(config['pydantic_model'].model_json_schema(), option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(config['prompt'].encode("utf-8") + b"|" + schema).hexdigest()[:16]
+
+# --- Image Processing ---
+@st.cache_data(show_spinner=False, max_entries=8)
+def prepare_image(file_bytes: bytes) -> tuple[bytes, str]:
+    """Decodes an upload and returns `(jpeg_bytes, jpeg_sha256)`; the JPEG doubles as the preview.
+
+    Cached on the file bytes so widget-triggered reruns skip the decode/encode work.
+    """
+    img = Image.open(BytesIO(file_bytes))
+    # Opening only reads the header; small RGB JPEGs are already in the target format, so skip the re-encode.
+    # Files with EXIF are re-encoded so GPS and other metadata never leave the app and the orientation is applied.
+    if img.format == "JPEG" and img.mode == "RGB" and max(img.size) <= max(MAX_IMAGE_SIZE) and not img.info.get("exif"):
+        return file_bytes, hashlib.sha256(file_bytes).hexdigest()
+    if img.format == "JPEG":
+        # Let libjpeg decode straight to RGB at a reduced scale.
+        img.draft("RGB", MAX_IMAGE_SIZE)
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        # Convert before resizing; Pillow falls back to NEAREST for palette and 1-bit images.
+        img = img.convert("RGB")
+    # Gemini tiles images to ~768px, so a 1024px long edge keeps quality while shrinking every request.
+    img.thumbnail(MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
+    buffered = BytesIO()
+    img.save(buffered, format="JPEG", quality=85, optimize=True, progressive=True)
+    jpeg_bytes = buffered.getvalue()
+    return jpeg_bytes, hashlib.sha256(jpeg_bytes).hexdigest()
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_image_part(image_sha: str, _image_bytes: bytes) -> dict:
+    """Builds the Gemini image message part once per image and shares it across the combined call and retries.
+
+    Treat the returned dict as read-only; it is the same object for every caller.
+    """
+    image_base64 = base64.b64encode(_image_bytes).decode("ascii")
+    return {"type": "image_url", "image_url": f"data:image/jpeg;base64,{image_base64}"}
+
+# --- Ledger Files ---
+def _read_ledger(path: Path):
+    """Returns the JSON stored at `path`, or `None` if it is missing, expired or unreadable. Expired files are deleted."""
+    try:
+        if time.time() - path.stat().st_mtime < RESPONSE_CACHE_TTL:
+            return orjson.loads(path.read_bytes())
+        path.unlink(missing_ok=True)
+    except (OSError, orjson.JSONDecodeError):
+        pass
+    return None
+
+def _prune_ledger_dir(directory: Path) -> None:
+    """Deletes expired entries, including temp files left by a crash, so the ledger stays bounded by its TTL."""
+    expires_before = time.time() - RESPONSE_CACHE_TTL
+    for entry in directory.iterdir():
+        try:
+            if entry.stat().st_mtime < expires_before:
+                entry.unlink(missing_ok=True)
+        except OSError:
+            # Another session may have replaced or removed it meanwhile.
+            pass
+
+def _write_ledger(path: Path, content) -> None:
+    """Writes `content` as JSON via a temp file and `os.replace`, so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _prune_ledger_dir(path.parent)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp_file:
+        tmp_file.write(orjson.dumps(content))
+    try:
+        os.replace(tmp_file.name, path)
+    except OSError:
+        os.unlink(tmp_file.name)
+        raise
+
 # --- Core Generation Function ---
-def generate_for_platform(platform_key: str, image_base64: str, business_context: str, pydantic_model: Type[BaseModel]):
+def _validate_platform(platform_key: str, raw_value: str) -> dict:
+    """Parses and validates one platform's JSON in a single pydantic-core pass. Raises `ValidationError`."""
+    return PLATFORM_CONFIG[platform_key]['pydantic_model'].model_validate_json(raw_value).model_dump()
+
+def _format_validation_feedback(error: ValidationError) -> str:
+    return "\n".join(
+        f"- {'.'.join(str(part) for part in item['loc']) or 'response'}: {item['msg']}"
+        for item in error.errors(include_url=False)
+    )
+
+def _invoke_model(platform_keys: tuple[str, ...], image_part: dict, business_context: str, on_partial: Optional[Callable[[str], None]] = None, on_invalid: Optional[Callable[[str, str, str], None]] = None, on_valid: Optional[Callable[[str, dict], None]] = None) -> dict:
+    """Generates content for all given platforms in one Gemini call, so the image is sent once.
+
+    The response is streamed; `on_partial` receives the raw JSON text as it grows, and each platform is
+    validated as soon as its object closes; `on_invalid(key, raw_value, feedback)` is called for any that fail
+    and `on_valid(key, content)` for any that pass, so they are kept even if the stream fails later.
+    Returns a dict keyed by platform; missing or invalid platforms are left out.
+    Raises `ValueError` if the response holds no JSON object or none of its platforms validate.
+    """
+    from langchain_core.messages import HumanMessage
+    prompt_text = (
+        PROMPT_PREFIX
+        + (business_context or "Not provided. Analyze the image for general appeal.")
+        + get_prompt_suffix(platform_keys)
+    )
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    if not google_api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+    # The deadline covers the whole stream, which grows with the number of platforms.
+    model = get_llm(MODEL_NAME, 0.7, REQUEST_TIMEOUT * len(platform_keys))
+    message = HumanMessage(content=[{"type": "text", "text": prompt_text}, image_part])
+    scanner = JsonMemberScanner()
+    results = {}
+    for chunk in model.stream([message]):
+        for key, raw_value in scanner.feed(chunk.content):
+            if key not in platform_keys or key in results:
+                continue
+            try:
+                results[key] = _validate_platform(key, raw_value)
+            except ValidationError as e:
+                if on_invalid:
+                    on_invalid(key, raw_value, _format_validation_feedback(e))
+                continue
+            if on_valid:
+                on_valid(key, results[key])
+        if on_partial:
+            on_partial(scanner.text)
+    if not scanner.saw_object:
+        raise ValueError("The model response did not contain a JSON object.")
+    if not results:
+        raise ValueError("No platform in the model response matched its schema.")
+    return results
+
+def _repair_platform(platform_key: str, previous_output: str, feedback: str) -> dict:
+    """Asks the model to fix an invalid platform object using a short text-only prompt. Raises on failure.
+
+    The image and full instructions are not resent; the previous output already reflects them.
+    """
     config = PLATFORM_CONFIG[platform_key]
-    parser = JsonOutputParser(pydantic_object=pydantic_model)
-    prompt_text = f"""
-    You are an expert social media manager. Your task is to create content for {config['name']} based on the provided image and business context.
-    **Business Context:**
-    {business_context if business_context else "Not provided. Analyze the image for general appeal."}
-    **Platform Instructions ({config['name']}):**
-    {config['prompt']}
-    **Output Format:**
-    You MUST provide your response in a valid JSON object that strictly follows this schema. Do not add any text before or after the JSON.
-    Schema:
-    {parser.get_format_instructions()}
+    prompt_text = REPAIR_PROMPT_TEMPLATE.format_map({
+        "name": config['name'],
+        "previous_output": previous_output,
+        "feedback": feedback,
+        "schema": orjson.dumps(config['pydantic_model'].model_json_schema()).decode("utf-8"),
+    })
+    response_text = get_llm(MODEL_NAME, 0.0).invoke(prompt_text).content
+    return _validate_platform(platform_key, response_text[response_text.find("{"):response_text.rfind("}") + 1])
+
+def _ledger_path(image_sha: str, business_context: str, platform_key: str, model_name: str) -> Path:
+    cache_key = hashlib.sha256(
+        "|".join([image_sha, business_context, platform_key, model_name, get_schema_version(platform_key)]).encode("utf-8")
+    ).hexdigest()
+    return RESPONSE_CACHE_DIR / f"{cache_key}.json"
+
+def cached_generate(image_sha: str, business_context: str, platform_keys: tuple[str, ...], model_name: str, image_bytes: bytes, on_partial: Optional[Callable[[str], None]] = None, on_invalid: Optional[Callable[[str, str, str], None]] = None) -> dict:
+    """Serves each platform from the on-disk ledger and batches the rest into one model call.
+
+    Only validated platforms are written to the ledger, so a missing or invalid platform is requested again
+    next time rather than served as a cached failure. Platforms the model left out are missing from the result.
+    Platforms that validated before the model call raised are already in the ledger, so a retry reads them from disk.
+    """
+    results = {}
+    ledger_paths = {key: _ledger_path(image_sha, business_context, key, model_name) for key in platform_keys}
+    for key, path in ledger_paths.items():
+        content = _read_ledger(path)
+        if content is not None:
+            results[key] = content
+    missing = tuple(key for key in platform_keys if key not in results)
+    if missing:
+        def keep_platform(key: str, content: dict):
+            # Written as each platform validates, so a stream that fails later does not bill it again.
+            _write_ledger(ledger_paths[key], content)
+            results[key] = content
+
+        _invoke_model(missing, get_image_part(image_sha, image_bytes), business_context, on_partial, on_invalid, keep_platform)
+    return results
+
+def generate_for_platform(platform_key: str, image_bytes: bytes, image_sha: str, business_context: str, previous_output: Optional[str] = None, feedback: Optional[str] = None):
+    """Generates content for one platform and returns `(platform_key, content, error)`.
+
+    Given an invalid `previous_output` and its `feedback`, a cheap repair is tried before a full request.
+    Kept free of Streamlit calls so it can run in a worker thread; the caller reports errors.
+    Failures are returned rather than raised so each platform's error can be reported on its own.
     """
     try:
-        google_api_key = os.getenv("GOOGLE_API_KEY")
-        if not google_api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables.")
-        model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.7, google_api_key=google_api_key)
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": prompt_text},
-                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{image_base64}"}
-            ]
-        )
-        response = model.invoke([message])
-        parsed_content = parser.parse(response.content)
-        return parsed_content
+        content = None
+        if previous_output is not None:
+            try:
+                content = _repair_platform(platform_key, previous_output, feedback)
+                _write_ledger(_ledger_path(image_sha, business_context, platform_key, MODEL_NAME), content)
+            except Exception:
+                # Fall back to a full request with the image.
+                content = None
+        if content is None:
+            content = cached_generate(image_sha, business_context, (platform_key,), MODEL_NAME, image_bytes).get(platform_key)
+        if not content:
+            raise ValueError("The model response was missing this platform or did not match its schema.")
+        return platform_key, content, None
     except Exception as e:
-        st.error(f"Error generating content for {config['name']}: {e}")
-        return None
+        return platform_key, None, e
+
+# --- Generation Ledger ---
+def _generation_ledger_path(image_sha: str, business_context: str) -> Path:
+    context_sha = hashlib.sha256(business_context.encode("utf-8")).hexdigest()
+    return GENERATION_LEDGER_DIR / f"{image_sha}-{context_sha}.json"
+
+def load_saved_generation(image_sha: str, business_context: str) -> dict:
+    """Returns the last generated content for this image and context, or `{}` if none is fresh on disk."""
+    return _read_ledger(_generation_ledger_path(image_sha, business_context)) or {}
+
+def save_generation(image_sha: str, business_context: str, generated_content: dict):
+    """Persists generated content so a refresh or server restart can resume without calling the model."""
+    _write_ledger(_generation_ledger_path(image_sha, business_context), generated_content)
+
+# --- Display Formatting ---
+def format_for_display(platform_key: str, content_data: dict) -> list[tuple[str, str]]:
+    """Returns the `(title, text)` sections shown in a platform's tab; callers keep them in `display_cache`."""
+    if platform_key == 'instagram':
+        full_caption = content_data.get('caption', '')
+        hashtags = " ".join(content_data.get('hashtags', []))
+        return [
+            ("Caption", f"{full_caption}{INSTAGRAM_HASHTAG_SEPARATOR}{hashtags}"),
+            ("Alt Text", content_data.get('alt_text', '')),
+        ]
+    # Driven by the model's fields so resumed content from an older schema renders without surprises.
+    sections = []
+    for field_name in PLATFORM_CONFIG[platform_key]['pydantic_model'].model_fields:
+        value = content_data.get(field_name)
+        field_title = field_name.replace('_', ' ').title()
+        if isinstance(value, list):
+            display_value = " ".join(value) if field_name == 'hashtags' else ", ".join(value)
+        else:
+            display_value = value if value else ""
+        sections.append((field_title, display_value))
+    return sections
 
 # --- UI Layout ---
 st.title("🚀 AI Social Media Content Generator")
@@ -143,37 +457,49 @@ with col1:
     )
 
     if uploaded_file:
-        if st.session_state.last_uploaded_filename != uploaded_file.name:
-            st.session_state.generated_content = {}
-            st.session_state.last_uploaded_filename = uploaded_file.name
+        if app_state.last_uploaded_filename != uploaded_file.name:
+            app_state.generated_content = {}
+            app_state.display_cache = {}
+            app_state.last_uploaded_filename = uploaded_file.name
         
         # Process and store the image
-        img = Image.open(uploaded_file)
-        st.session_state.pil_image = img  # Store PIL image in session state
-        
-        buffered = BytesIO()
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
-        img.save(buffered, format="JPEG")
-        st.session_state.image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        (
+            app_state.image_jpeg_bytes,
+            app_state.image_sha,
+        ) = prepare_image(uploaded_file.getvalue())
     
     st.subheader("2. Describe Your Work (Optional)")
-    st.session_state.business_context = st.text_area(
+    app_state.business_context = st.text_area(
         "Describe Your Work (Optional)",
-        value=st.session_state.business_context,
+        value=app_state.business_context,
         placeholder="e.g., I run an online academy teaching Quran to children.",
         help="Providing context helps the AI generate more relevant posts!",
         label_visibility="collapsed"
     )
 
+    # Resume earlier output for this image and context, e.g. after a refresh or restart.
+    resume_key = (app_state.image_sha, app_state.business_context)
+    if app_state.image_sha and app_state.resume_key != resume_key:
+        app_state.resume_key = resume_key
+        saved_content = load_saved_generation(*resume_key)
+        if saved_content:
+            app_state.generated_content = saved_content
+            app_state.display_cache = {
+                key: format_for_display(key, content)
+                for key, content in saved_content.items()
+            }
+            if not st.session_state.get("platform_multiselect"):
+                st.session_state.platform_multiselect = list(saved_content)
+
 # --- Column 2: Preview and Actions ---
 with col2:
     st.subheader("Image Preview")
-    if st.session_state.pil_image:
+    if app_state.image_jpeg_bytes:
         st.image(
-            st.session_state.pil_image,
+            app_state.image_jpeg_bytes,
             caption="Your uploaded image",
-            use_container_width=True
+            use_container_width=True,
+            output_format="JPEG"
         )
     else:
         st.info("Your uploaded image will be shown here.")
@@ -181,80 +507,111 @@ with col2:
     st.markdown("---")
     st.subheader("3. Select Platforms")
     
-    selected_platforms = []
-    num_columns = 5
-    icon_cols = st.columns(num_columns)
-    
-    for i, (key, config) in enumerate(PLATFORM_CONFIG.items()):
-        with icon_cols[i % num_columns]:
-            if st.checkbox(f"{config['icon']} {config['name']}", key=f"cb_{key}", value=(key in st.session_state.platforms_selected)):
-                selected_platforms.append(key)
+    # A single multiselect costs one widget per rerun instead of one checkbox per platform.
+    selected_platforms = st.multiselect(
+        "Select Platforms",
+        options=list(PLATFORM_CONFIG.keys()),
+        format_func=lambda key: f"{PLATFORM_CONFIG[key]['icon']} {PLATFORM_CONFIG[key]['name']}",
+        key="platform_multiselect",
+        label_visibility="collapsed"
+    )
 
-    st.session_state.platforms_selected = selected_platforms
+    app_state.platforms_selected = selected_platforms
     
     st.markdown("---")
     
-    can_generate = st.session_state.image_base64 and st.session_state.platforms_selected
+    can_generate = app_state.image_jpeg_bytes and app_state.platforms_selected
     
     if st.button("✨ Generate Content", type="primary", use_container_width=True, disabled=not can_generate):
         with st.status("Generating content...", expanded=True) as status:
-            st.session_state.generated_content = {}
-            for platform_key in st.session_state.platforms_selected:
-                platform_name = PLATFORM_CONFIG[platform_key]['name']
-                status.update(label=f"✍️ Crafting post for {platform_name}...")
-                content = generate_for_platform(
-                    platform_key,
-                    st.session_state.image_base64,
-                    st.session_state.business_context,
-                    PLATFORM_CONFIG[platform_key]['pydantic_model']
-                )
-                if content:
-                    st.session_state.generated_content[platform_key] = content
+            app_state.generated_content = {}
+            selected = app_state.platforms_selected
+            status.update(label=f"✍️ Crafting posts for {len(selected)} platform(s)...")
+            live_preview = st.empty()
+            # Platform calls are independent, so run them concurrently; UI updates stay on this thread.
+            with ThreadPoolExecutor(max_workers=min(len(selected), MAX_CONCURRENT_REQUESTS)) as executor:
+                retries = {}
+
+                def retry_platform(platform_key: str, previous_output: Optional[str] = None, feedback: Optional[str] = None):
+                    if platform_key not in retries:
+                        retries[platform_key] = executor.submit(
+                            generate_for_platform,
+                            platform_key,
+                            app_state.image_jpeg_bytes,
+                            app_state.image_sha,
+                            app_state.business_context,
+                            previous_output,
+                            feedback
+                        )
+
+                try:
+                    # Platforms that fail validation mid-stream are retried while the rest keeps streaming.
+                    app_state.generated_content = dict(cached_generate(
+                        app_state.image_sha,
+                        app_state.business_context,
+                        tuple(selected),
+                        MODEL_NAME,
+                        app_state.image_jpeg_bytes,
+                        lambda partial: live_preview.code(partial, language="json"),
+                        retry_platform
+                    ))
+                except Exception as e:
+                    # Every platform is retried on its own below; surface why the combined call failed.
+                    st.warning(f"Combined request failed, retrying each platform individually: {e}")
+                live_preview.empty()
+                for platform_key in selected:
+                    if platform_key not in app_state.generated_content:
+                        retry_platform(platform_key)
+                if retries:
+                    status.update(label=f"✍️ Retrying {len(retries)} platform(s) individually...")
+                for done, future in enumerate(as_completed(retries.values()), start=1):
+                    platform_key, content, error = future.result()
+                    platform_name = PLATFORM_CONFIG[platform_key]['name']
+                    if error:
+                        st.error(f"Error generating content for {platform_name}: {error}")
+                    elif content:
+                        app_state.generated_content[platform_key] = content
+                    status.update(label=f"✍️ {platform_name} done ({done}/{len(retries)})...")
             
-            if st.session_state.generated_content:
-                st.session_state.just_generated = True
+            app_state.display_cache = {
+                key: format_for_display(key, content)
+                for key, content in app_state.generated_content.items()
+            }
+            if app_state.generated_content:
+                save_generation(
+                    app_state.image_sha,
+                    app_state.business_context,
+                    app_state.generated_content
+                )
+                app_state.just_generated = True
 
             status.update(label="✅ All content generated!", state="complete")
 
 # --- Display Generated Content (Full Width) ---
-if st.session_state.generated_content:
+if app_state.generated_content:
     st.markdown("<div id='output-anchor'></div>", unsafe_allow_html=True)
     st.markdown("---")
     st.subheader("🎉 Your Generated Content")
     
     platform_keys_with_content = [
-        key for key in st.session_state.platforms_selected 
-        if key in st.session_state.generated_content
+        key for key in app_state.platforms_selected 
+        if key in app_state.generated_content
     ]
     
     tabs = st.tabs([PLATFORM_CONFIG[key]['name'] for key in platform_keys_with_content])
 
     for i, tab in enumerate(tabs):
         platform_key = platform_keys_with_content[i]
-        content_data = st.session_state.generated_content[platform_key]
+        sections = app_state.display_cache.get(platform_key)
+        if sections is None:
+            sections = format_for_display(platform_key, app_state.generated_content[platform_key])
         
         with tab:
-            if platform_key == 'instagram':
-                st.subheader("Caption")
-                full_caption = content_data.get('caption', '')
-                hashtags = " ".join(content_data.get('hashtags', []))
-                display_caption = f"{full_caption}\n\n.\n.\n.\n\n{hashtags}"
-                st.code(display_caption, language=None)
-                
-                st.subheader("Alt Text")
-                alt_text = content_data.get('alt_text', '')
-                st.code(alt_text, language=None)
-            else:
-                for field, value in content_data.items():
-                    field_title = field.replace('_', ' ').title()
-                    if isinstance(value, list):
-                        display_value = " ".join(value) if field == 'hashtags' else ", ".join(value)
-                    else:
-                        display_value = value if value else ""
-                    st.subheader(field_title)
-                    st.code(display_value, language=None)
-
-    if st.session_state.get("just_generated", False):
+            for title, text in sections:
+                st.subheader(title)
+                st.code(text, language=None)
+
+    if app_state.just_generated:
         js_code = """
         <script>
             setTimeout(function() {
@@ -266,7 +623,7 @@ if st.session_state.generated_content:
         </script>
         """
         st.components.v1.html(js_code)
-        st.session_state.just_generated = False
+        app_state.just_generated = False
 
 
 
@@ -1,2 +1,60 @@
-# LangGraph nodes and graph logic for social media post generation.
-# This file will contain the implementation for generating posts using LangGraph.
+# Generation helpers for social media post generation.
+# Holds the scanner that splits a streamed JSON response into per-platform objects.
+
+
+class JsonMemberScanner:
+    """Tracks a streamed JSON object and reports each top-level member whose object value has closed.
+
+    Lets a platform be validated, and retried if needed, while the rest of the response is still streaming.
+    Text outside any JSON container, such as a preamble or code fence, is skipped, and members are only
+    reported when the top-level container is an object.
+    """
+    def __init__(self):
+        self.text = ""
+        self.saw_object = False
+        self._pos = 0
+        self._depth = 0
+        self._top_is_object = False
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """Appends streamed text and returns `(key, raw_value)` for every member completed by it."""
+        self.text += chunk
+        text = self.text
+        completed = []
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._depth == 0:
+                # Between containers only an opening bracket matters; quotes here are plain prose.
+                if char in "{[":
+                    self._depth = 1
+                    self._top_is_object = char == "{"
+                    self.saw_object = self.saw_object or self._top_is_object
+                    self._key = None
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._key = text[self._string_start + 1:i]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "{" and self._top_is_object:
+                    self._value_start = i
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    completed.append((self._key, text[self._value_start:i + 1]))
+                    self._value_start = None
+        self._pos = len(text)
+        return completed
@@ -0,0 +1,55 @@
+import unittest
+
+from modules.generator import JsonMemberScanner
+
+
+def feed_all(chunks):
+    scanner = JsonMemberScanner()
+    members = []
+    for chunk in chunks:
+        members.extend(scanner.feed(chunk))
+    return scanner, members
+
+
+class JsonMemberScannerTests(unittest.TestCase):
+    def test_reports_each_member_as_it_closes(self):
+        scanner = JsonMemberScanner()
+        self.assertEqual(scanner.feed('{"x": {"tweet": "hi"}, "link'), [("x", '{"tweet": "hi"}')])
+        self.assertEqual(scanner.feed('edin": {"post_text": "yo"}}'), [("linkedin", '{"post_text": "yo"}')])
+        self.assertTrue(scanner.saw_object)
+
+    def test_string_escapes_do_not_end_the_string(self):
+        raw = '{"caption": "a \\"quoted\\" } { brace \\\\", "tags": ["#a"]}'
+        _, members = feed_all(['{"instagram": ' + raw + '}'])
+        self.assertEqual(members, [("instagram", raw)])
+
+    def test_chunk_boundary_inside_escape_sequence(self):
+        raw = '{"tweet": "say \\"}\\" now"}'
+        text = '{"x": ' + raw + '}'
+        split = text.index("\\") + 1
+        _, members = feed_all([text[:split], text[split:]])
+        self.assertEqual(members, [("x", raw)])
+
+    def test_preamble_with_quotes_and_braces_is_skipped(self):
+        chunks = ['Here is your "JSON" {as requested}:\n```json\n', '{"x": {"tweet": "hi"}}\n```']
+        _, members = feed_all(chunks)
+        self.assertEqual(members, [("x", '{"tweet": "hi"}')])
+
+    def test_top_level_array_reports_nothing(self):
+        scanner, members = feed_all(['["x", {"tweet": "hi"}]'])
+        self.assertEqual(members, [])
+        self.assertFalse(scanner.saw_object)
+
+    def test_truncated_response_reports_only_closed_members(self):
+        scanner, members = feed_all(['{"x": {"tweet": "hi"}, "linkedin": {"post_text": "cut o'])
+        self.assertEqual(members, [("x", '{"tweet": "hi"}')])
+        self.assertTrue(scanner.saw_object)
+
+    def test_plain_text_has_no_object(self):
+        scanner, members = feed_all(["I can't help with that."])
+        self.assertEqual(members, [])
+        self.assertFalse(scanner.saw_object)
+
+
+if __name__ == "__main__":
+    unittest.main()